@@ -1,17 +1,370 @@
-import re, os
-from typing import Tuple
+import re, os, io, time, json, hashlib, subprocess, queue, tempfile, threading, sqlite3, zlib, collections, multiprocessing, concurrent.futures
+from typing import Tuple, Optional, Callable, NamedTuple
+import markdown, pygments
 from markdown import Markdown
 from pygments import highlight
 from pygments.lexers import PythonLexer
 from pygments.formatters import HtmlFormatter
 
-md = Markdown(extensions=['mdx_math'], extension_configs={'mdx_math': { 'enable_dollar_delimiter': True }})
+md_extensions        = ['mdx_math']
+md_extension_configs = {'mdx_math': { 'enable_dollar_delimiter': True }}
+md = Markdown(extensions=md_extensions, extension_configs=md_extension_configs)
+python_lexer   = PythonLexer()
+html_formatter = HtmlFormatter()
+
+#############################################
+# Fragment cache
+class FragmentCache:
+    """
+    Content-addressed disk cache for the HTML fragments produced by `CodeBlock` and `CommentBlock`.
+
+    Every entry is a single file named after its key. Entries are written to a temporary file first
+    and moved into place with `os.replace`, so concurrent worker processes never read half-written
+    fragments. Reading an entry refreshes its mtime, which `prune` uses to evict the least recently
+    used entries once the cache grows beyond `max_bytes`.
+    """
+    # Everything besides the section text that changes the produced HTML.
+    environment = "pygments={}|markdown={}|extensions={!r}|configs={!r}".format(
+        pygments.__version__, markdown.__version__, md_extensions, md_extension_configs
+    )
+
+    def __init__(self, cache_dir: str, max_bytes: int=256 * 1024 * 1024, environment: str=None) -> None:
+        if environment is not None:
+            self.environment = environment
+        self.cache_dir     = cache_dir
+        self.max_bytes     = max_bytes
+        self.bytes_written = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, kind: str, text: str) -> str:
+        h = hashlib.sha256()
+        for part in (kind, self.environment, text):
+            h.update(part.encode("utf8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key[2:])
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            # Missing, or evicted by another process in the meantime.
+            return None
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.bytes_written += len(data)
+        # Do not scan the whole cache on every write.
+        if self.bytes_written > self.max_bytes // 10:
+            self.prune()
+
+    def prune(self) -> None:
+        """ Removes least recently used entries until the cache fits into `max_bytes`. """
+        self.bytes_written = 0
+        entries = []
+        total   = 0
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+fragment_cache = None
+
+def enable_fragment_cache(cache_dir: str, max_bytes: int=256 * 1024 * 1024) -> FragmentCache:
+    """ Enables the on-disk fragment cache for all following renderings. """
+    global fragment_cache
+    fragment_cache = FragmentCache(cache_dir, max_bytes)
+    return fragment_cache
+
+def cached_fragment(kind: str, text: str, render: Callable[[str], str]) -> str:
+    """ Returns `render(text)`, served from the fragment cache if it is enabled. """
+    if fragment_cache is None:
+        return render(text)
+    key  = fragment_cache.make_key(kind, text)
+    data = fragment_cache.get(key)
+    if data is not None:
+        return data.decode("utf8")
+    fragment = render(text)
+    fragment_cache.set(key, fragment.encode("utf8"))
+    return fragment
+
+#############################################
+# Fast Markdown
+class FastMarkdown:
+    """
+    Lightweight Markdown renderer for the subset PyDoc comments typically use: paragraphs, `#` headings,
+    bullet lists nested up to one level, inline code, emphasis, inline HTML tags and `$...$` / `$$...$$` math.
+
+    The output matches the one of `md` after `Page.clean_markdown_for_katex`, hence emphasis is not
+    emitted at all. `convert` returns `None` for every construct it does not support, so the caller can
+    fall back to Python-Markdown.
+    """
+    inline_tags = {"a", "abbr", "b", "br", "code", "em", "i", "img", "kbd", "s", "small", "span", "strong", "sub", "sup", "u"}
+
+    # Lines which would start a block construct outside of the supported subset (indented/code blocks
+    # except nested list items, quotes, ordered lists, setext headings, rulers, more than six #).
+    re_unsupported_line = re.compile(r"^(?: {4}(?![*+-][ ])| {0,3}>| {0,3}\d+\.[ ]|[=-]+[ ]*$| {0,3}(?:[-*_][ ]{0,2}){3,}[ ]*$|#{7})", re.M)
+    re_unsupported_char = re.compile(r"[\t\x02\x03]|``|<!|&#(?!\d+;|x[0-9a-fA-F]+;)")
+    re_heading          = re.compile(r"^(#{1,6})(.*?)#*$")
+    re_list_item        = re.compile(r"^[ ]{0,3}[*+-][ ]+(.*)$", re.M)
+    re_child_item       = re.compile(r"^[ ]{4}[*+-][ ]+(.*)$")
+    re_code             = re.compile(r"`(.+?)`", re.S)
+    re_display_math     = re.compile(r"\$\$([^\$]+)\$\$")
+    re_inline_math      = re.compile(r"(?<!\$)\$([^\$]+)\$")
+    re_html_tag         = re.compile(r"</?([a-zA-Z][a-zA-Z0-9]*)(?: +[a-zA-Z-]+=\"[^\"<>]*\")* */?>")
+    re_stray_lt         = re.compile(r"<(?![ 0-9=]|$)")
+    re_tag_name         = re.compile(r"</?([a-zA-Z][a-zA-Z0-9]*)")
+    re_entity           = re.compile(r"&(?:#[0-9]+|#x[0-9a-fA-F]+|[a-zA-Z0-9]+);")
+    # Only delimiters which open after whitespace and close before whitespace or punctuation,
+    # those are unambiguous for the old and the delimiter-run based emphasis of Python-Markdown.
+    re_strong           = re.compile(r"(?<!\S)\*\*([^\W_](?:[^*]*[^\W_])?)\*\*(?![^\s.,;:!?)])")
+    re_emphasis         = re.compile(r"(?<!\S)\*([^\W_](?:[^*]*[^\W_])?)\*(?![^\s.,;:!?)])")
+    re_placeholder      = re.compile(r"\x02(\d+)\x03")
+    re_stray_underscore = re.compile(r"(?<![^\W_])_|_(?![^\W_])")
+
+    class Unsupported(Exception):
+        pass
+
+    def convert(self, text: str) -> Optional[str]:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if text.strip() == r"":
+            return r""
+        # Same whitespace normalization as Python-Markdown: only lines after a newline are emptied.
+        text = re.sub(r"(?<=\n) +\n", "\n", text + "\n\n")
+        if self.re_unsupported_line.search(text) or self.re_unsupported_char.search(text):
+            return None
+        # Block level HTML is stashed by Python-Markdown before anything else is parsed.
+        if any(x.lower() not in self.inline_tags for x in self.re_tag_name.findall(text)):
+            return None
+        blocks = [x.lstrip("\n") for x in text.split("\n\n")]
+        try:
+            html = []
+            for block in blocks:
+                if block != r"":
+                    self._render_block(block.split("\n"), html)
+        except self.Unsupported:
+            return None
+        return "\n".join(x for _, x in html).strip()
+
+    def _render_block(self, lines: list, html: list):
+        for idx, line in enumerate(lines):
+            heading = self.re_heading.match(line)
+            if heading:
+                if idx > 0:
+                    self._render_block(lines[:idx], html)
+                level = len(heading.group(1))
+                html.append(("h", "<h{0}>{1}</h{0}>".format(level, self._render_inline(heading.group(2).strip()))))
+                if idx + 1 < len(lines):
+                    self._render_block(lines[idx + 1:], html)
+                return
+
+        if self.re_list_item.match(lines[0]):
+            # Blank lines between items would make the list loose.
+            if html and html[-1][0] == "ul":
+                raise self.Unsupported()
+            items = []
+            for line in lines:
+                item  = self.re_list_item.match(line)
+                child = self.re_child_item.match(line)
+                if item:
+                    items.append((item.group(1), []))
+                elif child:
+                    items[-1][1].append(child.group(1))
+                elif items[-1][1]:
+                    # Lazy continuation of a nested item
+                    raise self.Unsupported()
+                else:
+                    items[-1] = (items[-1][0] + "\n" + line, [])
+            html.append(("ul", self._render_list(items)))
+        elif any(self.re_child_item.match(x) for x in lines):
+            raise self.Unsupported()
+        elif not all(x.isspace() or x == r"" for x in lines):
+            html.append(("p", "<p>{}</p>".format(self._render_inline("\n".join(lines).lstrip()))))
+
+    def _render_list(self, items: list) -> str:
+        html = []
+        for text, children in items:
+            # Items are parsed as blocks on their own, only plain text is supported there.
+            if text.strip() == r"" or self.re_list_item.match(text) or self.re_unsupported_line.search(text) \
+                    or text.lstrip().startswith(("#", ">")):
+                raise self.Unsupported()
+            html.append("<li>{}{}</li>".format(
+                self._render_inline(text.lstrip()),
+                self._render_list([(x, []) for x in children]) + "\n" if children else r""
+            ))
+        return "<ul>\n{}\n</ul>".format("\n".join(html))
+
+    @staticmethod
+    def _apply(pattern: re.Pattern, replace: Callable, text: str) -> str:
+        """ Like `pattern.sub`, but every search continues on the already replaced text as Python-Markdown does. """
+        m = pattern.search(text)
+        while m:
+            replacement = replace(m)
+            text = text[:m.start()] + replacement + text[m.end():]
+            m = pattern.search(text, m.start() + len(replacement))
+        return text
+
+    def _render_inline(self, text: str) -> str:
+        # Rendered pieces are stashed behind placeholders, together with their kind:
+        # "text" (raw HTML, entities), "elem" (inline elements), "close" (end of an element) or "math".
+        stash = []
+        def store(kind: str, fragment: str) -> str:
+            stash.append((kind, fragment))
+            return "\x02{}\x03".format(len(stash) - 1)
+
+        def store_code(m):
+            code = m.group(1).strip().replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            return store("elem", "<code>{}</code>".format(code))
+
+        def store_math(script_type: str):
+            def store_script(m):
+                if "\x02" in m.group(1) or "\\(" in m.group(1) or "\\[" in m.group(1) or "\\begin" in m.group(1):
+                    raise self.Unsupported()
+                return store("math", '<script type="{}">{}</script>'.format(script_type, m.group(1)))
+            return store_script
+
+        def store_html(m):
+            if m.group(1).lower() not in self.inline_tags:
+                raise self.Unsupported()
+            return store("text", m.group(0))
+
+        def store_element(tag: str):
+            def store_wrapped(m):
+                if any(stash[int(x)][0] == "math" for x in self.re_placeholder.findall(m.group(1))):
+                    raise self.Unsupported()
+                # Emphasis is stripped from the page anyway, see Page.clean_markdown_for_katex.
+                return store("elem", "<{}>".format(tag) if tag else r"") + m.group(1) \
+                    + store("close", "</{}>".format(tag) if tag else r"")
+            return store_wrapped
+
+        text = self._apply(self.re_code, store_code, text)
+        text = self._apply(self.re_display_math, store_math("math/tex; mode=display"), text)
+        text = self._apply(self.re_inline_math, store_math("math/tex"), text)
+        # Escapes, links, images and unmatched delimiters are left to Python-Markdown.
+        if any(x in text for x in ("\\", "[", "]", "`", "$")):
+            raise self.Unsupported()
+        text = text.replace("  \n", store("br", "<br />"))
+        text = self._apply(self.re_html_tag, store_html, text)
+        if self.re_stray_lt.search(text):
+            raise self.Unsupported()
+        text = self._apply(self.re_entity, lambda m: store("text", m.group(0)), text)
+        text = self._apply(self.re_strong, store_element("strong"), text)
+        text = self._apply(self.re_emphasis, store_element(r""), text)
+        if "*" in text or self.re_stray_underscore.search(text):
+            raise self.Unsupported()
+        text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+        # Python-Markdown treats <script> as block level element and <br /> gets a trailing newline:
+        # whitespace-only text around them is replaced by a newline.
+        tokens = self.re_placeholder.split(text)
+        pieces = [("lit", x) if i % 2 == 0 else stash[int(x)] for i, x in enumerate(tokens)]
+        first_child = next((i for i, x in enumerate(pieces) if x[0] in ("elem", "br", "math")), None)
+        if first_child is not None and pieces[first_child][0] == "math" \
+                and all(x[1].isspace() or x[1] == r"" for x in pieces[:first_child]):
+            pieces[:first_child] = [("lit", "\n")]
+        html = []
+        idx  = 0
+        while idx < len(pieces):
+            kind, fragment = pieces[idx]
+            html.append(fragment)
+            idx += 1
+            if kind not in ("br", "math"):
+                continue
+            end = idx
+            while end < len(pieces) and pieces[end][0] in ("lit", "text"):
+                end += 1
+            tail = r"".join(x[1] for x in pieces[idx:end])
+            if tail.isspace() or tail == r"":
+                html.append("\n")
+            else:
+                html.append(("\n" if kind == "br" else r"") + tail)
+            idx = end
+        return r"".join(html)
+
+markdown_backends = ("markdown", "fast")
+markdown_backend  = "markdown"
+fast_md = FastMarkdown()
+
+def set_markdown_backend(backend: str) -> None:
+    """ Selects the renderer of comments: "markdown" (Python-Markdown) or "fast" (`FastMarkdown`). """
+    assert backend in markdown_backends, "Unknown Markdown backend {}.".format(backend)
+    global markdown_backend
+    markdown_backend = backend
+
+def convert_markdown(text: str) -> str:
+    if markdown_backend == "fast":
+        html = fast_md.convert(text)
+        if html is not None:
+            return html
+    return md.convert(text)
+
+#############################################
+# Run report
+class RunReport:
+    """ Statistics of a single `pydoc_runner` run. """
+    def __init__(self) -> None:
+        self.written  = 0
+        self.skipped  = 0
+        self.degraded = [] # (source path, reason) of files rendered on the degraded path
+        self.minified_bytes_saved = 0
+        self.deduplicated = 0
+
+    def summary(self) -> str:
+        lines = ["{} files written, {} unchanged files skipped.".format(self.written, self.skipped)]
+        if self.deduplicated:
+            lines.append("{} duplicate files reused an already rendered page body.".format(self.deduplicated))
+        if self.minified_bytes_saved:
+            lines.append("Minification saved {} bytes.".format(self.minified_bytes_saved))
+        for path, reason in self.degraded:
+            lines.append("Degraded {}: {}".format(path, reason))
+        return "\n".join(lines)
+
+class RenderTimeout(Exception):
+    """ Raised when a file exceeds its render time budget. """
+    pass
+
+def check_deadline(deadline: Optional[float]) -> None:
+    if deadline is not None and time.monotonic() > deadline:
+        raise RenderTimeout()
+
+run_report = RunReport()
 
 #############################################
 # Export HTML
 class CodeBlock:
     head_content     = \
-        "<style>{}</style>".format(HtmlFormatter().get_style_defs('.highlight')).replace(".highlight { background: #f8f8f8; }", "") # Remove white background
+        "<style>{}</style>".format(html_formatter.get_style_defs('.highlight')).replace(".highlight { background: #f8f8f8; }", "") # Remove white background
     head_content += \
         r"""
         <style>
@@ -44,7 +397,9 @@ class CodeBlock:
         self.code_str += code_block
 
     def render(self):
-        c = highlight(self.code_str, PythonLexer(), HtmlFormatter()) if self.code_str != r"" else r""
+        c = cached_fragment(
+            "code", self.code_str, lambda code: highlight(code, python_lexer, html_formatter)
+        ) if self.code_str != r"" else r""
         block = self.html_template.replace(
             self.code_key_phrase,
             c
@@ -55,7 +410,17 @@ class CodeBlock:
     def is_empty(self):
         return self.code_str == r""
 
-    
+
+class PlainCodeBlock(CodeBlock):
+    """ Code block without syntax highlighting, used for the degraded rendering of huge files. """
+    def render(self):
+        return self.html_template.replace(
+            self.code_key_phrase,
+            "<pre>{}</pre>".format(
+                self.code_str.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            ) if self.code_str != r"" else r""
+        )
+
 class CommentBlock:
     head_content = \
         r"""
@@ -102,6 +467,7 @@ class CommentBlock:
 
     def __init__(self) -> None:
         self.comment_str = r""
+        self.html_str    = r""
 
     def clean_inside_comment(self, str_block: str):
         """ Remove leading comment symbols. """
@@ -129,9 +495,15 @@ class CommentBlock:
     def add_plain(self, comment_str: str):
         self.comment_str += comment_str
 
+    def add_html(self, comment_html: str):
+        """ Adds already rendered HTML, which is not passed through Markdown. """
+        self.html_str += comment_html
+
     def render(self):
+        content = cached_fragment("comment:" + markdown_backend, self.comment_str, convert_markdown) \
+            if self.comment_str != r"" or self.html_str == r"" else r""
         block = self.html_template.replace(
-            self.comment_key_phrase, md.convert(self.comment_str) 
+            self.comment_key_phrase, content + self.html_str
         )
         return block
 
@@ -186,8 +558,10 @@ class Section:
         self.comment = CommentBlock()
         self.code    = CodeBlock()
 
-    def addCommentBlock(self, comment: str, is_inside: bool=False, is_plain: bool=False):
-        if is_plain:
+    def addCommentBlock(self, comment: str, is_inside: bool=False, is_plain: bool=False, is_html: bool=False):
+        if is_html:
+            self.comment.add_html(comment)
+        elif is_plain:
             self.comment.add_plain(comment)
         else:
             self.comment.add(comment, is_inside)
@@ -216,11 +590,34 @@ class Header(Section):
     def __init__(self) -> None:
         super().__init__()
 
+    # Pages of a directory share their breadcrumbs, so the links and the rendered header are memoized.
+    breadcrumbs      = {}
+    rendered_headers = {}
+    max_memoized     = 4096
+
+    @classmethod
+    def breadcrumb_html(cls, parent_list: list) -> str:
+        key = tuple(tuple(x) for x in parent_list)
+        tmp = cls.breadcrumbs.get(key)
+        if tmp is None:
+            if len(cls.breadcrumbs) >= cls.max_memoized:
+                cls.breadcrumbs.clear()
+            tmp = cls.breadcrumbs[key] = r"".join(
+                r"""<a class="parent" href="{}">{}</a>""".format(parent[1], parent[0]) for parent in parent_list
+            )
+        return tmp
+
     def add_parents(self, parent_list: list) -> None:
-        tmp = r""
-        for parent in parent_list:
-            tmp += r"""<a class="parent" href="{}">{}</a>""".format(parent[1], parent[0])
-        self.addCommentBlock(tmp, is_plain=True)
+        self.addCommentBlock(self.breadcrumb_html(parent_list), is_plain=True)
+
+    def render(self, section_id: int):
+        key = (section_id, markdown_backend, self.comment.comment_str, self.comment.html_str, self.code.code_str)
+        _html = self.rendered_headers.get(key)
+        if _html is None:
+            if len(self.rendered_headers) >= self.max_memoized:
+                self.rendered_headers.clear()
+            _html = self.rendered_headers[key] = super().render(section_id)
+        return _html
 
 class Footer(Section):
     html_template = \
@@ -316,32 +713,233 @@ class Page:
         _html = _html.replace("</em>", "")
         return _html
 
-    def render(self):
+    def render(self, deadline: float=None, executor: concurrent.futures.Executor=None, chunk_size: int=256):
+        return self.assemble(self.render_sections(deadline, executor, chunk_size))
+
+    def assemble(self, sections: list[str]) -> str:
+        """ Builds the page HTML around already rendered sections, the header being the first one. """
         _html = self.html_template.replace(
             self.head_content_key_phrase,
             self.head_content
         )
-        for i, section in enumerate(self.sections):
-            _html = _html.replace(
-                self.sections_key_phrase, 
-                section.render(section_id=i),
-                1 # Replace only first occurrence
-            )
-            _html = _html.replace(
-                self.sections_key_phrase,
-                self.sections_key_phrase * 2
-            )
-
-        _html = _html.replace(self.sections_key_phrase, self.footer.render(), 1)
-        _html = _html.replace(self.sections_key_phrase, "")
+        prefix, _, suffix = _html.partition(self.sections_key_phrase * 2)
+        _html = prefix + r"".join(sections) + self.footer.render() + suffix
         _html = self.clean_markdown_for_katex(_html)
         return _html
 
+    def render_sections(self, deadline: float=None, executor: concurrent.futures.Executor=None, chunk_size: int=256):
+        """ Renders all sections in order. With an `executor`, chunks of sections are rendered in parallel. """
+        if executor is None:
+            rendered = []
+            for i, section in enumerate(self.sections):
+                check_deadline(deadline)
+                rendered.append(section.render(section_id=i))
+            # A single expensive section must not pass unnoticed either.
+            check_deadline(deadline)
+            return rendered
+
+        futures = [
+            executor.submit(render_section_chunk, first, self.sections[first:first + chunk_size])
+            for first in range(0, len(self.sections), chunk_size)
+        ]
+        rendered = []
+        try:
+            for future in futures:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                rendered.extend(future.result(timeout))
+        except concurrent.futures.TimeoutError:
+            for future in futures:
+                future.cancel()
+            raise RenderTimeout()
+        return rendered
+
     def dump(self, file_path):
         assert file_path.endswith(".html"), "Only HTML export is supported."
-        f = open(file_path, "w", encoding="utf8")
-        f.write(self.render())
-        f.close()
+        return write_html(file_path, self.render())
+
+def render_section_chunk(first_id: int, sections: list[Section]) -> list[str]:
+    """ Worker function of the parallel page rendering, `first_id` is the id of the first section. """
+    return [section.render(section_id=first_id + i) for i, section in enumerate(sections)]
+
+def init_section_worker(backend: str, cache_dir: Optional[str], cache_max_bytes: int) -> None:
+    """ Applies the renderer settings of the main process, which spawned workers do not inherit. """
+    set_markdown_backend(backend)
+    if cache_dir is not None:
+        enable_fragment_cache(cache_dir, cache_max_bytes)
+
+def render_page_sections(parsed: list, parent_link: list) -> list[str]:
+    """ Worker function of the budgeted page rendering. """
+    return build_page(parsed, parent_link).render_sections()
+
+def worker_context() -> multiprocessing.context.BaseContext:
+    """
+    Worker pools are created while the pipeline threads run, so workers are never forked from the
+    threaded process.
+    """
+    return multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+def worker_initargs() -> tuple:
+    return (
+        markdown_backend,
+        None if fragment_cache is None else fragment_cache.cache_dir,
+        0 if fragment_cache is None else fragment_cache.max_bytes
+    )
+
+def section_pool(workers: int=None) -> concurrent.futures.ProcessPoolExecutor:
+    """ Creates a process pool for rendering the sections of large pages. """
+    return concurrent.futures.ProcessPoolExecutor(
+        workers, mp_context=worker_context(), initializer=init_section_worker, initargs=worker_initargs()
+    )
+
+def budget_pool() -> "multiprocessing.pool.Pool":
+    """
+    Creates the single worker process rendering pages under a time budget. Unlike the workers of a
+    `ProcessPoolExecutor`, it can be terminated in the middle of a section.
+    """
+    return worker_context().Pool(1, initializer=init_section_worker, initargs=worker_initargs())
+
+#############################################
+# Minification
+html_block_tags = {
+    "!doctype", "html", "head", "body", "title", "meta", "link", "style", "div", "p", "ul", "ol", "li",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "table", "tr", "td", "th", "blockquote", "hr"
+}
+re_html_protected = re.compile(r"<(pre|script|textarea)\b.*?</\1\s*>", re.S | re.I)
+re_html_any_tag   = re.compile(r"(<[^<>]*>)")
+re_html_tag_name  = re.compile(r"</?(!?[a-zA-Z0-9]+)")
+re_html_space     = re.compile(r"[ \t\r\n\f]+")
+
+def minify_html(_html: str) -> str:
+    """
+    Collapses insignificant whitespace: runs of whitespace become a single space, which is dropped
+    entirely next to block level tags. Contents of <pre> (the highlighted code), <script> (the math)
+    and <textarea> are kept untouched.
+    """
+    # Alternating text and tags, protected elements count as tags.
+    tokens = []
+    last   = 0
+    for m in re_html_protected.finditer(_html):
+        tokens += re_html_any_tag.split(_html[last:m.start()])
+        tokens.append(m.group(0))
+        last = m.end()
+    tokens += re_html_any_tag.split(_html[last:])
+
+    def is_block(idx: int) -> bool:
+        if idx < 0 or idx >= len(tokens):
+            return True
+        name = re_html_tag_name.match(tokens[idx])
+        return name is not None and name.group(1).lower() in html_block_tags
+
+    for idx in range(0, len(tokens), 2):
+        text = re_html_space.sub(" ", tokens[idx])
+        if is_block(idx - 1):
+            text = text.lstrip(" ")
+        if is_block(idx + 1):
+            text = text.rstrip(" ")
+        tokens[idx] = text
+    return r"".join(tokens)
+
+def write_html(file_path: str, _html: str) -> bool:
+    """ Writes `_html` to `file_path`, unless the file already holds exactly these bytes. Returns whether the file was written. """
+    data = _html.replace("\n", os.linesep).encode("utf8")
+    try:
+        with open(file_path, "rb") as f:
+            # Size is checked first, so only files of equal length are read.
+            unchanged = os.fstat(f.fileno()).st_size == len(data) and f.read() == data
+    except OSError:
+        unchanged = False
+    if unchanged:
+        run_report.skipped += 1
+        return False
+    with open(file_path, "wb") as f:
+        f.write(data)
+    run_report.written += 1
+    return True
+
+#############################################
+# SQLite doc store
+class SqliteDocStore:
+    """
+    Output backend keeping all pages of a build in a single SQLite database instead of a doc directory.
+
+    Rows are keyed by the page path relative to the doc root, with "/" separators, e.g. "sub/index.html".
+    Only pages whose content hash differs from the stored one are upserted, in transactions of
+    `batch_size` rows. `close` removes the rows of pages that were not produced by the run.
+    """
+    schema = \
+        r"""
+        CREATE TABLE IF NOT EXISTS pages (
+            path         TEXT PRIMARY KEY,
+            content      BLOB NOT NULL,
+            compressed   INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            source_hash  TEXT
+        )
+        """
+
+    def __init__(self, db_path: str, root_doc: str, compress: bool=False, batch_size: int=500) -> None:
+        self.db_path    = db_path
+        self.root_doc   = root_doc
+        self.compress   = compress
+        self.batch_size = batch_size
+        # Written by the write stage of the pipeline only, which is a different thread than the creating one.
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute(self.schema)
+        self.hashes  = dict(self.connection.execute("SELECT path, content_hash FROM pages"))
+        self.seen    = set()
+        self.pending = []
+
+    def page_path(self, doc_path: str) -> str:
+        return os.path.relpath(doc_path, self.root_doc).replace(os.sep, "/")
+
+    def write(self, doc_path: str, _html: str, source_hash: str=None) -> bool:
+        """ Stores a page, unless the stored one is identical. Returns whether the page was written. """
+        path = self.page_path(doc_path)
+        data = _html.encode("utf8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        self.seen.add(path)
+        if self.hashes.get(path) == content_hash:
+            run_report.skipped += 1
+            return False
+        if self.compress:
+            data = zlib.compress(data)
+        self.pending.append((path, data, int(self.compress), content_hash, source_hash))
+        self.hashes[path] = content_hash
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        run_report.written += 1
+        return True
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO pages (path, content, compressed, content_hash, source_hash) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET content=excluded.content, compressed=excluded.compressed, "
+                "content_hash=excluded.content_hash, source_hash=excluded.source_hash",
+                self.pending
+            )
+        self.pending = []
+
+    def close(self, remove_stale: bool=True) -> None:
+        self.flush()
+        stale = [(path,) for path in self.hashes if path not in self.seen] if remove_stale else []
+        with self.connection:
+            self.connection.executemany("DELETE FROM pages WHERE path = ?", stale)
+        self.connection.close()
+
+def read_doc_page(db_path: str, path: str) -> Optional[str]:
+    """ Returns the page stored under `path` (e.g. "sub/index.html") in a doc store, or None. """
+    connection = sqlite3.connect(db_path)
+    try:
+        row = connection.execute("SELECT content, compressed FROM pages WHERE path = ?", (path,)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    content, compressed = row
+    return (zlib.decompress(content) if compressed else content).decode("utf8")
 
 ################################################################################
 ################################################################################
@@ -405,7 +1003,7 @@ def find_header_end(lines) -> int:
             return idx-1
     return idx
 
-def extract_header(lines):
+def extract_header(lines, deadline: float=None):
     """ Returns sections object and first line of non-header part. """
     line_header_end = find_header_end(lines)
     section = Section()
@@ -413,6 +1011,8 @@ def extract_header(lines):
     was_inline = False
     line_idx = 0
     for _, _ in enumerate(lines):
+        # Files without any def or class are a single header section.
+        check_deadline(deadline)
         if is_empty(lines[line_idx]):
             # Empty line
             section.addCommentBlock("<br>", True)
@@ -527,68 +1127,227 @@ def extract_inline_code_section(line_inline_comment_starts, lines):
 
 #############################################################################
 #############################################################################
-## Starting point of single file processing
-def pydoc(py_path: str, html_path: str=None, parent_link: list=[]):
-    try:
-        with open(py_path, 'r', encoding="utf8") as py_file:
-            page = Page()
-            py_lines = py_file.readlines()
-
-            ## Add header to page
-            header_section = Header()
-            header_section.add_parents(parent_link)
-            page.add_header(header_section)
-
-            ## Import Code Header manually
-            header_code_section, search_start = extract_header(py_lines)
-            page.add_section(header_code_section)
-
-            focus_on = search_start
-            # To avoid infinite loops
-            for _ in range(search_start, len(py_lines)): 
-                if focus_on >= len(py_lines):
-                    break
+## Intermediate representation of a parsed file
+class ParsedSection(NamedTuple):
+    """ A parsed section of a python file, independent of any HTML template. """
+    kind: str               # "header", "def_class" or "inline"
+    lines: Tuple[int, int]  # First and last source line, zero based and inclusive
+    comment: str
+    code: str
+
+    @classmethod
+    def from_section(cls, kind: str, lines: Tuple[int, int], section: Section) -> "ParsedSection":
+        return cls(kind, lines, section.comment.comment_str, section.code.code_str)
+
+    def to_section(self) -> Section:
+        section = Section()
+        section.addCommentBlock(self.comment, is_plain=True)
+        section.addCodeBlock(self.code)
+        return section
+
+# Bump whenever the parser output changes, so cached representations are invalidated.
+parser_version = 2
+parse_cache    = None
+
+def enable_parse_cache(cache_dir: str, max_bytes: int=256 * 1024 * 1024) -> FragmentCache:
+    """ Enables the on-disk cache of parsed files, keyed by the hash of the source. """
+    global parse_cache
+    parse_cache = FragmentCache(cache_dir, max_bytes, environment="parser={}".format(parser_version))
+    return parse_cache
+
+def parse_lines(py_lines: list[str], deadline: float=None) -> list[ParsedSection]:
+    parsed = []
+    # The extractors may stop one line past the end of the file.
+    last_line = len(py_lines) - 1
+
+    ## Import Code Header manually
+    header_code_section, search_start = extract_header(py_lines, deadline)
+    parsed.append(ParsedSection.from_section("header", (0, min(search_start - 1, last_line)), header_code_section))
+
+    focus_on = search_start
+    # To avoid infinite loops
+    for _ in range(search_start, len(py_lines)): 
+        if focus_on >= len(py_lines):
+            break
+        check_deadline(deadline)
 
-                ## Continue if empty
-                if is_empty(py_lines[focus_on]):
-                    focus_on += 1
-                    continue
+        ## Continue if empty
+        if is_empty(py_lines[focus_on]):
+            focus_on += 1
+            continue
 
-                ## If Def or Class instance starts
-                if is_class(focus_on, py_lines) or is_def(focus_on, py_lines):
-                    s, i = extract_def_class_header(focus_on, py_lines)
-                    page.add_section(s)
-                    focus_on = i
-                    continue
-                elif is_inline_comment(focus_on, py_lines):
-                ## if inline comment starts
-                    s, i = extract_inline_code_section(focus_on, py_lines)
-                    page.add_section(s)
-                    focus_on = i
-                    continue
-                
-                focus_on += 1
+        ## If Def or Class instance starts
+        if is_class(focus_on, py_lines) or is_def(focus_on, py_lines):
+            s, i = extract_def_class_header(focus_on, py_lines)
+            parsed.append(ParsedSection.from_section("def_class", (focus_on, min(i - 1, last_line)), s))
+            focus_on = i
+            continue
+        elif is_inline_comment(focus_on, py_lines):
+        ## if inline comment starts
+            s, i = extract_inline_code_section(focus_on, py_lines)
+            parsed.append(ParsedSection.from_section("inline", (focus_on, min(i - 1, last_line)), s))
+            focus_on = i
+            continue
+        
+        focus_on += 1
+    return parsed
+
+def parse_source(source: str, deadline: float=None) -> list[ParsedSection]:
+    """ Parses the text of a python file, served from the parse cache if it is enabled. """
+    if parse_cache is None:
+        return parse_lines(io.StringIO(source).readlines(), deadline)
+    key  = parse_cache.make_key("parsed", source)
+    data = parse_cache.get(key)
+    if data is not None:
+        return [ParsedSection(kind, tuple(lines), comment, code) for kind, lines, comment, code in json.loads(data)]
+    parsed = parse_lines(io.StringIO(source).readlines(), deadline)
+    # JSON instead of pickle, the cache directory may be shared and loading it must never run code.
+    parse_cache.set(key, json.dumps([tuple(x) for x in parsed]).encode("utf8"))
+    return parsed
+
+def build_page(parsed: list[ParsedSection], parent_link: list=[]) -> Page:
+    """ Renders parsed sections into a page, the parser is not involved anymore. """
+    page = Page()
+
+    ## Add header to page
+    header_section = Header()
+    header_section.add_parents(parent_link)
+    page.add_header(header_section)
+
+    for parsed_section in parsed:
+        page.add_section(parsed_section.to_section())
+    return page
 
-            if (html_path is not None):
-                page.dump(html_path)
-            return page.render()
+def build_degraded_page(source: str, parent_link: list=[], highlight: bool=False) -> Page:
+    """ Fast path for huge files: the whole source as a single code block, without any Markdown. """
+    page = Page()
+
+    ## Add header to page
+    header_section = Header()
+    header_section.add_parents(parent_link)
+    page.add_header(header_section)
 
+    section = Section()
+    if not highlight:
+        section.code = PlainCodeBlock()
+    section.addCodeBlock(source)
+    page.add_section(section)
+    return page
+
+#############################################################################
+#############################################################################
+## Starting point of single file processing
+def read_source(py_path: str) -> str:
+    try:
+        with open(py_path, 'r', encoding="utf8") as py_file:
+            return py_file.read()
     except FileNotFoundError:
         print("Python file {} cannot be found.".format(
             py_path
         ))
         exit(-1)
 
+def minify_page(_html: str) -> str:
+    """ `minify_html` with the saved bytes accounted in the run report. """
+    minified = minify_html(_html)
+    # Only ASCII whitespace is removed, so characters equal bytes.
+    run_report.minified_bytes_saved += len(_html) - len(minified)
+    return minified
+
+def render_source(source: str, parent_link: list=[],
+                  section_executor: Callable[[Page], Optional[concurrent.futures.Executor]]=None,
+                  minify: bool=False) -> str:
+    """ Renders a source, `section_executor` picks the pool rendering the sections of a page, if any. """
+    page  = build_page(parse_source(source), parent_link)
+    _html = page.render(executor=None if section_executor is None else section_executor(page))
+    if minify:
+        _html = minify_page(_html)
+    return _html
+
+def pydoc_source(text: str, parent_link: list=[], parallel_sections: int=None, workers: int=None,
+                 minify: bool=False, encoding: str=None):
+    """
+    Renders the documentation of python source text held in memory, no file is read or written.
+
+    Args:
+
+    * text: Source of the python file.
+    * parent_link: Breadcrumb links of the page as (name, href) tuples.
+    * parallel_sections: Optional section count above which the sections are rendered in parallel
+      by a pool of `workers` processes.
+    * minify: Collapse insignificant whitespace of the HTML.
+    * encoding: Optional encoding, the HTML is returned as bytes if given.
+    """
+    _html, = (h for _, h in pydoc_many([(None, text)], parent_link, parallel_sections, workers, minify, encoding))
+    return _html
+
+def pydoc_many(items, parent_link: list=[], parallel_sections: int=None, workers: int=None,
+               minify: bool=False, encoding: str=None):
+    """
+    Renders an iterable of (name, text) python sources held in memory and yields (name, html) pairs
+    in the same order. The lexer, formatter, Markdown converter and the optional section pool
+    are shared by all items.
+
+    Args:
+
+    * items: Iterable of (name, text) tuples, `name` is passed through untouched.
+    * parent_link: Breadcrumb links of the pages as (name, href) tuples, or a callable
+      mapping the name of an item to its breadcrumb links.
+    * parallel_sections, workers, minify, encoding: See `pydoc_source`.
+    """
+    executor = None
+
+    def section_executor(page: Page) -> Optional[concurrent.futures.Executor]:
+        # The pool is only started for the first page above `parallel_sections`.
+        nonlocal executor
+        if parallel_sections is None or len(page.sections) <= parallel_sections:
+            return None
+        if executor is None:
+            executor = section_pool(workers)
+        return executor
+
+    try:
+        for name, text in items:
+            links = parent_link(name) if callable(parent_link) else parent_link
+            _html = render_source(text, links, section_executor, minify)
+            yield name, (_html if encoding is None else _html.encode(encoding))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+def pydoc(py_path: str, html_path: str=None, parent_link: list=[], parallel_sections: int=None, workers: int=None,
+          minify: bool=False):
+    """
+    Args:
+
+    * py_path: Path of the python file.
+    * html_path: Optional path of the HTML file to write.
+    * parent_link: Breadcrumb links of the page as (name, href) tuples.
+    * parallel_sections: Optional section count above which the sections are rendered in parallel
+      by a pool of `workers` processes.
+    * minify: Collapse insignificant whitespace of the HTML.
+    """
+    _html = pydoc_source(read_source(py_path), parent_link, parallel_sections, workers, minify)
+    if (html_path is not None):
+        write_html(html_path, _html)
+    return _html
+
 
 #############################################################################
 #############################################################################
 ## Starting point of multi directory processing
+def is_doc_dir(dir_name: str) -> bool:
+    return '__pycache__' not in dir_name
+
+def is_doc_file(file_name: str) -> bool:
+    return file_name.endswith('.py') and '__init__' not in file_name
+
 def get_dirs(root_path: str):
     """ Returns list of directories in the current path alphabetically sorted. """
     _dirs = []
     for _dir in os.listdir(root_path):
         if os.path.isdir(os.path.join(root_path, _dir)):
-            if '__pycache__' in _dir:
+            if not is_doc_dir(_dir):
                 continue
             _dirs.append(_dir)
     return sorted(_dirs)
@@ -598,14 +1357,32 @@ def get_pyFiles(root_path: str):
     _files = []
     for _file in os.listdir(root_path):
         if os.path.isfile(os.path.join(root_path, _file)):
-            if not _file.endswith('.py'):
-                continue
-            if '__init__' in _file:
+            if not is_doc_file(_file):
                 continue
             _files.append(_file)
     return sorted(_files)
 
-def create_index_html_file(root_src: str, root_doc: str, parent_link: list=[("Home", "index.html")]):
+def child_parent_link(parent_link: list[Tuple[str, str]], c_dir: str) -> list[Tuple[str, str]]:
+    """ Breadcrumb links of the pages in the subdirectory `c_dir`. """
+    next_parent_link = [(x[0], "../" + x[1]) for x in parent_link]
+    next_parent_link.append((c_dir, "index.html"))
+    return next_parent_link
+
+def escape_html(text: str, quote: bool=False) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;") if quote else text
+
+def get_index_entries(root_src: str) -> list[Tuple[str, bool]]:
+    """ Returns the (name, is_dir) entries listed by the index page of a directory, files first. """
+    return [(x.replace('.py', ''), False) for x in get_pyFiles(root_src)] + [(x, True) for x in get_dirs(root_src)]
+
+def index_page_name(page_no: int) -> str:
+    """ File name of the n-th page of a paginated index, "-" keeps it apart from python module names. """
+    return "index.html" if page_no == 1 else "index-{}.html".format(page_no)
+
+def build_index_page(root_src: str, parent_link: list=[("Home", "index.html")], entries: list[Tuple[str, bool]]=None,
+                     page_no: int=1, page_count: int=1) -> Page:
+    """ Index page listing `entries` (all entries of `root_src` by default), generated as HTML directly. """
     page = Page()
 
     ## Add header to page
@@ -614,66 +1391,621 @@ def create_index_html_file(root_src: str, root_doc: str, parent_link: list=[("Ho
     page.add_header(header_section)
 
     ###
-    files = get_pyFiles(root_src)
-    dirs  = get_dirs(root_src)
+    if entries is None:
+        entries = get_index_entries(root_src)
 
-    table = r""
     if parent_link == [("Home", "index.html")]:
-        table += (r"#  Home &#127969 " + "\n\n")
+        table = r"<h1>Home &#127969;</h1>"
     else:
-        table += ("# " + os.path.basename(root_src) + "\n\n")
-
-    for _file in files:
-        table += (r"""- <a href="{}.html">{}</a>""".format(_file.replace('.py', ''), _file.replace('.py', '')) + "\n")
+        table = "<h1>{}</h1>".format(escape_html(os.path.basename(root_src)))
 
-    for _dir in dirs:
-        table += (r"""* <a href="{}/index.html">{}</a> <b>></b>""".format(_dir, _dir) + "\n")
+    items = []
+    for name, is_dir in entries:
+        if is_dir:
+            items.append(r"""<li><a href="{}/index.html">{}</a> <b>&gt;</b></li>""".format(escape_html(name, True), escape_html(name)))
+        else:
+            items.append(r"""<li><a href="{}.html">{}</a></li>""".format(escape_html(name, True), escape_html(name)))
+    if items:
+        table += "\n<ul>\n{}\n</ul>".format("\n".join(items))
+
+    if page_count > 1:
+        pager = []
+        for no in range(1, page_count + 1):
+            if no == page_no:
+                pager.append("<b>{}</b>".format(no))
+            else:
+                pager.append(r"""<a href="{}">{}</a>""".format(index_page_name(no), no))
+        table += '\n<p class="pager">{}</p>'.format(" ".join(pager))
 
     section = Section()
-    section.addCommentBlock(table)
+    section.addCommentBlock(table, is_html=True)
     page.add_section(section)
+    return page
+
+def index_tasks(src_dir: str, doc_dir: str, parent_link: list[Tuple[str, str]], page_size: int=None,
+                entries: list[Tuple[str, bool]]=None, remove_stale: bool=True):
+    """
+    Yields the build tasks of the index pages of a directory and, with `remove_stale`, removes pages
+    left over from larger listings. Builds into a doc store leave the filesystem alone.
+    """
+    if entries is None:
+        entries = get_index_entries(src_dir)
+    page_size  = page_size or max(len(entries), 1)
+    page_count = max(1, -(-len(entries) // page_size))
+    for page_no in range(1, page_count + 1):
+        task = BuildTask("index", src_dir, os.path.join(doc_dir, index_page_name(page_no)), parent_link)
+        task.entries    = entries[(page_no - 1) * page_size:page_no * page_size]
+        task.page_no    = page_no
+        task.page_count = page_count
+        yield task
+
+    if remove_stale:
+        remove_index_pages(doc_dir, page_count + 1)
+
+def remove_index_pages(doc_dir: str, first_page: int=1) -> None:
+    """ Removes the index pages of a directory from page `first_page` on. """
+    page_no = first_page
+    while os.path.isfile(os.path.join(doc_dir, index_page_name(page_no))):
+        os.remove(os.path.join(doc_dir, index_page_name(page_no)))
+        page_no += 1
 
-    page.dump(os.path.join(root_doc,"index.html"))
+def create_index_html_file(root_src: str, root_doc: str, parent_link: list=[("Home", "index.html")]):
+    build_index_page(root_src, parent_link).dump(os.path.join(root_doc,"index.html"))
     return parent_link
 
+#############################################################################
+#############################################################################
+## Streaming build pipeline
+class BuildTask:
+    """ A single output page travelling through the build pipeline. """
+    def __init__(self, kind: str, src_path: str, doc_path: str, parent_link: list) -> None:
+        self.kind        = kind        # "file" or "index"
+        self.src_path    = src_path    # Python file, or source directory of an index page
+        self.doc_path    = doc_path
+        self.parent_link = parent_link
+        self.parsed      = None
+        self.html        = None
+        self.entries     = None # Listing of an index page
+        self.page_no     = 1
+        self.page_count  = 1
+        self.source      = None # Only kept for the degraded path
+        self.source_hash = None
+        self.duplicate   = False # Same source as an earlier file, its body is reused
+        self.degraded    = None # Reason for the degraded path
+        self.time_left   = None
+
+def scan_tree(root_src: str, root_doc: str, parent_link: list[Tuple[str, str]], index_page_size: int=None,
+              make_dirs: bool=True):
+    """ Yields the build tasks of a source tree one by one and creates the doc directories on the way. """
+    pending = [(root_src, root_doc, parent_link)]
+    while pending:
+        src_dir, doc_dir, parent_link = pending.pop()
+        if make_dirs and not os.path.isdir(doc_dir):
+            os.mkdir(doc_dir)
+
+        for c_dir in reversed(get_dirs(src_dir)):
+            pending.append((os.path.join(src_dir, c_dir), os.path.join(doc_dir, c_dir), child_parent_link(parent_link, c_dir)))
+
+        yield from index_tasks(src_dir, doc_dir, parent_link, index_page_size, remove_stale=make_dirs)
+        for py_file in get_pyFiles(src_dir):
+            yield BuildTask(
+                "file",
+                os.path.join(src_dir, py_file),
+                os.path.join(doc_dir, py_file.replace('.py', '.html')),
+                parent_link
+            )
 
-def pydoc_runner_process_dir(root_src: str, root_doc: str, parent_link: list[Tuple[str, str]]):
+class BuildPipeline:
+    """
+    Builds pages in the stages scan, parse, render and write. The stages run concurrently and are
+    connected by bounded queues, so reading and writing files overlaps with rendering, and the
+    number of pages in memory never exceeds the queue capacities, regardless of the tree size.
+    """
+    end_of_stream = None
+
+    def __init__(self, queue_size: int=64, max_file_bytes: int=None, max_lines: int=None,
+                 max_render_seconds: float=None, degraded_highlight: bool=False,
+                 parallel_sections: int=None, workers: int=None, chunk_size: int=256, minify: bool=False,
+                 store: SqliteDocStore=None, dedupe: bool=True, body_cache_bytes: int=32 * 1024 * 1024) -> None:
+        self.queue_size         = queue_size
+        self.max_file_bytes     = max_file_bytes
+        self.max_lines          = max_lines
+        self.max_render_seconds = max_render_seconds
+        self.degraded_highlight = degraded_highlight
+        self.parallel_sections  = parallel_sections
+        self.workers            = workers
+        self.chunk_size         = chunk_size
+        self.minify             = minify
+        self.store              = store # Pages are written to the doc directory without one
+        self.dedupe             = dedupe
+        self.body_cache_bytes   = body_cache_bytes
+        self.bodies             = collections.OrderedDict() # source hash -> rendered sections without header, LRU
+        self.body_bytes         = 0
+        self.seen_sources       = set()
+        self.degraded_sources   = {} # source hash -> reason, copies of a degraded file take the same path
+        self.executor           = None # Created for the first page above `parallel_sections`
+        self.budget_pool        = None # Created for the first page rendered under `max_render_seconds`
+        self.errors             = []
+
+    def section_executor(self, page: Page) -> Optional[concurrent.futures.Executor]:
+        if self.parallel_sections is None or len(page.sections) <= self.parallel_sections:
+            return None
+        if self.executor is None:
+            self.executor = section_pool(self.workers)
+        return self.executor
+
+    def degrade(self, task: BuildTask, source: str, reason: str):
+        task.source   = source
+        task.degraded = reason
+        task.parsed   = None
+        if self.dedupe and task.source_hash is not None:
+            self.degraded_sources[task.source_hash] = reason
+
+    def degrade_copy(self, task: BuildTask, source: str) -> bool:
+        """ Degrades a duplicate whose first copy was degraded, instead of spending the time budget again. """
+        reason = self.degraded_sources.get(task.source_hash)
+        if reason is not None:
+            self.degrade(task, source, reason)
+        return reason is not None
+
+    def parse(self, task: BuildTask):
+        if task.kind != "file":
+            return
+        source = read_source(task.src_path)
+        if self.store is not None or self.dedupe:
+            task.source_hash = hashlib.sha256(source.encode("utf8")).hexdigest()
+        if self.max_file_bytes is not None and len(source.encode("utf8")) > self.max_file_bytes:
+            return self.degrade(task, source, "larger than {} bytes".format(self.max_file_bytes))
+        if self.max_lines is not None and len(source.splitlines()) > self.max_lines:
+            return self.degrade(task, source, "more than {} lines".format(self.max_lines))
+
+        # The time budget is shared by parsing and rendering, but waiting in queues does not count.
+        start    = time.monotonic()
+        deadline = None if self.max_render_seconds is None else start + self.max_render_seconds
+        if self.dedupe and task.source_hash in self.seen_sources:
+            # Stages keep the order of the tasks, so the body of the first copy is rendered by then.
+            task.duplicate = True
+            task.source    = source
+            task.time_left = self.max_render_seconds
+            self.degrade_copy(task, source)
+            return
+        self.seen_sources.add(task.source_hash)
+        try:
+            task.parsed = parse_source(source, deadline)
+        except RenderTimeout:
+            return self.degrade(task, source, "parsing took more than {} s".format(self.max_render_seconds))
+        if deadline is not None:
+            task.source    = source
+            task.time_left = deadline - time.monotonic()
+
+    def render(self, task: BuildTask):
+        if task.kind == "index":
+            task.html = build_index_page(
+                task.src_path, task.parent_link, task.entries, task.page_no, task.page_count
+            ).render()
+        else:
+            self.render_file(task)
+        if self.minify:
+            task.html = minify_page(task.html)
+
+    def render_file(self, task: BuildTask):
+        # The first copy may have timed out after this one was parsed.
+        if task.duplicate and task.degraded is None:
+            self.degrade_copy(task, task.source)
+        if task.degraded is None:
+            deadline = None if task.time_left is None else time.monotonic() + task.time_left
+            try:
+                body = self.bodies.get(task.source_hash) if task.duplicate else None
+                if body is not None:
+                    self.bodies.move_to_end(task.source_hash)
+                    page      = build_page([], task.parent_link)
+                    task.html = page.assemble(page.render_sections() + body)
+                    run_report.deduplicated += 1
+                else:
+                    if task.parsed is None:
+                        # Duplicate of a file which was degraded or whose body was evicted already.
+                        task.parsed = parse_source(task.source, deadline)
+                    page     = build_page(task.parsed, task.parent_link)
+                    executor = self.section_executor(page)
+                    if deadline is not None and executor is None:
+                        sections = self.render_in_worker(task.parsed, task.parent_link, deadline)
+                    else:
+                        sections = page.render_sections(deadline, executor, self.chunk_size)
+                    task.html = page.assemble(sections)
+                    self.remember_body(task.source_hash, sections[1:])
+            except RenderTimeout:
+                self.degrade(task, task.source, "rendering took more than {} s".format(self.max_render_seconds))
+        if task.degraded is not None:
+            run_report.degraded.append((task.src_path, task.degraded))
+            task.html = build_degraded_page(task.source, task.parent_link, self.degraded_highlight).render()
+        task.parsed = None
+        task.source = None
+
+    def render_in_worker(self, parsed: list[ParsedSection], parent_link: list, deadline: float) -> list[str]:
+        """ Renders the sections of a budgeted page in the budget worker, which is terminated on a timeout. """
+        time_left = max(0.0, deadline - time.monotonic())
+        if self.budget_pool is None:
+            # Starting the worker does not count towards the budget of the file.
+            self.budget_pool = budget_pool()
+            self.budget_pool.apply(int)
+        result = self.budget_pool.apply_async(render_page_sections, (parsed, parent_link))
+        try:
+            return result.get(time_left)
+        except multiprocessing.TimeoutError:
+            # Highlighting a section cannot be interrupted, so the worker is given up.
+            self.budget_pool.terminate()
+            self.budget_pool = None
+            raise RenderTimeout()
+
+    def remember_body(self, source_hash: Optional[str], body: list[str]):
+        """ Keeps a rendered body for later copies, evicting the least recently used ones beyond `body_cache_bytes`. """
+        size = sum(len(x) for x in body)
+        if not self.dedupe or size > self.body_cache_bytes:
+            return
+        self.bodies[source_hash] = body
+        self.body_bytes += size
+        while self.body_bytes > self.body_cache_bytes:
+            _, evicted = self.bodies.popitem(last=False)
+            self.body_bytes -= sum(len(x) for x in evicted)
+
+    def write(self, task: BuildTask):
+        if self.store is not None:
+            self.store.write(task.doc_path, task.html, task.source_hash)
+        else:
+            write_html(task.doc_path, task.html)
+        task.html = None
+        if task.kind == "file":
+            print(f"Processing {os.path.basename(task.src_path)}... Done!")
+
+    def _run_stage(self, work, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        while True:
+            task = inbox.get()
+            if task is self.end_of_stream:
+                break
+            # After a failure the remaining tasks are only drained, so no stage blocks forever.
+            if self.errors:
+                continue
+            try:
+                work(task)
+            except BaseException as e:
+                self.errors.append(e)
+                continue
+            if outbox is not None:
+                outbox.put(task)
+        if outbox is not None:
+            outbox.put(self.end_of_stream)
+
+    def run(self, tasks) -> None:
+        """ Builds all tasks of the iterable `tasks`, e.g. `scan_tree(...)`. """
+        queues  = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        stages  = [
+            (self.parse,  queues[0], queues[1]),
+            (self.render, queues[1], queues[2]),
+            (self.write,  queues[2], None)
+        ]
+        threads = [threading.Thread(target=self._run_stage, args=stage, daemon=True) for stage in stages]
+        for thread in threads:
+            thread.start()
+        try:
+            for task in tasks:
+                if self.errors:
+                    break
+                queues[0].put(task)
+        finally:
+            queues[0].put(self.end_of_stream)
+            for thread in threads:
+                thread.join()
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+            if self.budget_pool is not None:
+                self.budget_pool.terminate()
+                self.budget_pool = None
+        if self.errors:
+            raise self.errors[0]
+
+
+#############################################################################
+#############################################################################
+## Partial builds driven by git diffs
+def git_changed_files(root_src: str, rev_from: str, rev_to: str=None) -> Tuple[list[str], list[str]]:
+    """
+    Asks git for the documented python files below `root_src` which differ between two revisions.
+    Without `rev_to` the working tree is compared, including untracked files which are not ignored.
+    Returns the changed (added, modified, renamed) and the deleted paths, both relative to `root_src`.
+    """
+    def run_git(*args: str) -> str:
+        try:
+            return subprocess.run(["git", "-C", root_src, *args], check=True, capture_output=True).stdout.decode("utf8")
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("git diff {}..{} failed for {}: {}".format(
+                rev_from, rev_to or "working tree", root_src, getattr(e, "stderr", b"").decode("utf8", "replace").strip() or e
+            ))
+            exit(-1)
+
+    output = run_git("diff", "--name-status", "-z", "-M", "--relative", rev_from, *([rev_to] if rev_to is not None else []), "--", ".")
+
+    def is_documented(path: str) -> bool:
+        parts = path.split("/")
+        return is_doc_file(parts[-1]) and all(is_doc_dir(x) for x in parts[:-1])
+
+    changed, deleted = [], []
+    fields = output.split("\0")
+    idx = 0
+    while idx < len(fields) - 1:
+        status = fields[idx]
+        if status[0] in "RC":
+            # Renames and copies list the old and the new path.
+            old_path, new_path = fields[idx + 1], fields[idx + 2]
+            idx += 3
+            if status[0] == "R" and is_documented(old_path):
+                deleted.append(old_path)
+            if is_documented(new_path):
+                changed.append(new_path)
+            continue
+        path = fields[idx + 1]
+        idx += 2
+        if not is_documented(path):
+            continue
+        if status[0] == "D":
+            deleted.append(path)
+        else:
+            changed.append(path)
+
+    if rev_to is None:
+        # git diff does not list files which were never added, they count as added.
+        for path in run_git("ls-files", "--others", "--exclude-standard", "-z", "--", ".").split("\0"):
+            if path and is_documented(path) and path not in changed:
+                changed.append(path)
+    return changed, deleted
+
+def git_diff_tasks(root_src: str, root_doc: str, rev_from: str, rev_to: str=None, index_page_size: int=None):
+    """
+    Yields the build tasks of the files changed between two revisions and of all their ancestor index
+    pages. Pages of deleted files are removed, as are doc directories whose source directory is gone.
+    The sources are read from the working tree, which is expected to be at `rev_to`.
+    """
     if not os.path.isdir(root_doc):
-        os.mkdir(root_doc)
-    
-    _dirs = get_dirs(root_src)
-    for c_dir in _dirs:
-        ##
-        if not os.path.isdir(os.path.join(root_doc, c_dir)):
-            os.mkdir(os.path.join(root_doc, c_dir))
-        next_parent_link = [(x[0], "../" + x[1]) for x in parent_link]
-        next_parent_link.append((c_dir, "index.html"))
-        ##
-        pydoc_runner_process_dir(
-            os.path.join(root_src, c_dir),
-            os.path.join(root_doc, c_dir),
-            next_parent_link
+        print("Partial builds need an existing doc directory, {} cannot be found.".format(root_doc))
+        exit(-1)
+    changed, deleted = git_changed_files(root_src, rev_from, rev_to)
+
+    ancestors = set()
+    for path in changed + deleted:
+        rel_dir = os.path.dirname(path)
+        while True:
+            ancestors.add(rel_dir)
+            if rel_dir == r"":
+                break
+            rel_dir = os.path.dirname(rel_dir)
+
+    def doc_path_of(path: str) -> str:
+        parts = path.split("/")
+        return os.path.join(root_doc, *parts[:-1], parts[-1].replace('.py', '.html'))
+
+    for path in deleted:
+        doc_path = doc_path_of(path)
+        if os.path.isfile(doc_path):
+            os.remove(doc_path)
+    # Deepest first, so a removed parent never has doc directories left below it.
+    for rel_dir in sorted(ancestors, key=lambda x: -len(x.split("/"))):
+        if rel_dir == r"" or os.path.isdir(os.path.join(root_src, *rel_dir.split("/"))):
+            continue
+        doc_dir = os.path.join(root_doc, *rel_dir.split("/"))
+        remove_index_pages(doc_dir)
+        if os.path.isdir(doc_dir) and not os.listdir(doc_dir):
+            os.rmdir(doc_dir)
+
+    parent_links = {}
+    for rel_dir in sorted(ancestors, key=lambda x: len(x.split("/")) if x else 0):
+        src_dir = os.path.join(root_src, *rel_dir.split("/"))
+        if not os.path.isdir(src_dir):
+            continue
+        if rel_dir == r"":
+            parent_links[rel_dir] = [("Home", "index.html")]
+        else:
+            parent_links[rel_dir] = child_parent_link(parent_links[os.path.dirname(rel_dir)], os.path.basename(rel_dir))
+        doc_dir = os.path.join(root_doc, *rel_dir.split("/"))
+        os.makedirs(doc_dir, exist_ok=True)
+        yield from index_tasks(src_dir, doc_dir, parent_links[rel_dir], index_page_size)
+
+    for path in changed:
+        src_path = os.path.join(root_src, *path.split("/"))
+        if not os.path.isfile(src_path):
+            continue
+        yield BuildTask(
+            "file",
+            src_path,
+            doc_path_of(path),
+            parent_links[os.path.dirname(path)]
         )
 
-    create_index_html_file(root_src, root_doc, parent_link)
 
-    _py_files = get_pyFiles(root_src)
-    for py_file in _py_files:
-        print(f"Processing {py_file}...", end=" ")
-        pydoc(
-            os.path.join(root_src, py_file), 
-            os.path.join(root_doc, py_file.replace('.py', '.html')),
-            parent_link=parent_link
-        )
-        print("Done!")
+#############################################################################
+#############################################################################
+## Sharded builds
+def shard_of(rel_path: str, shard_count: int) -> int:
+    """ Shard owning a source path relative to the source root. Unlike `hash`, it is stable across processes and machines. """
+    return int.from_bytes(hashlib.sha256(rel_path.encode("utf8")).digest()[:8], "big") % shard_count
+
+def shard_manifest_path(root_doc: str, shard: int, shard_count: int) -> str:
+    return os.path.join(root_doc, ".pydoc-shard-{}-of-{}.json".format(shard, shard_count))
 
-def pydoc_runner(root_src: str, root_doc: str):
+def shard_tasks(tasks, root_src: str, shard: int, shard_count: int, manifest: dict):
+    """
+    Passes on the file tasks owned by `shard`. Index pages are not rendered by shards, the listings
+    of the owned directories are collected in `manifest` for `pydoc_merge_shards` instead.
+    """
+    for task in tasks:
+        rel_path = os.path.relpath(task.src_path, root_src).replace(os.sep, "/")
+        if shard_of(rel_path, shard_count) != shard:
+            continue
+        if task.kind == "index":
+            manifest["listings"][rel_path] = {"parent_link": task.parent_link, "entries": task.entries}
+            continue
+        manifest["pages"].append(os.path.relpath(task.doc_path, manifest["root_doc"]).replace(os.sep, "/"))
+        yield task
+
+def write_shard_manifest(root_doc: str, shard: int, shard_count: int, manifest: dict) -> None:
+    path = shard_manifest_path(root_doc, shard, shard_count)
+    fd, tmp_path = tempfile.mkstemp(dir=root_doc, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf8") as f:
+        json.dump({"shard": shard, "shard_count": shard_count, "pages": manifest["pages"],
+                   "listings": manifest["listings"]}, f)
+    # mkstemp creates the file readable by its owner only, but the merge may run as another user.
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    os.replace(tmp_path, path)
+
+def pydoc_merge_shards(root_doc: str, shard_count: int, index_page_size: int=None, minify: bool=False,
+                       remove_manifests: bool=True):
+    """
+    Generates all index pages of a sharded build, once the doc directories of all shards are combined
+    in `root_doc`. The source tree is not needed, the listings are taken from the shard manifests.
+
+    Args:
+
+    * root_doc: Root path of the combined doc directory.
+    * shard_count: Number of shards the build was split into.
+    * index_page_size, minify: See `pydoc_runner`.
+    * remove_manifests: Delete the shard manifests after merging.
+    """
+    listings = {}
+    for shard in range(shard_count):
+        try:
+            with open(shard_manifest_path(root_doc, shard, shard_count), "r", encoding="utf8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            print("Manifest of shard {} of {} cannot be found in {}.".format(shard, shard_count, root_doc))
+            exit(-1)
+        # Catches shard outputs which were not (completely) copied into `root_doc`.
+        missing = [x for x in manifest["pages"] if not os.path.isfile(os.path.join(root_doc, *x.split("/")))]
+        if missing:
+            print("{} pages of shard {} of {} cannot be found in {}, e.g. {}.".format(
+                len(missing), shard, shard_count, root_doc, missing[0]
+            ))
+            exit(-1)
+        listings.update(manifest["listings"])
+
+    def tasks():
+        for rel_dir in sorted(listings):
+            listing = listings[rel_dir]
+            src_dir = os.path.join(*rel_dir.split("/"))
+            entries = [(name, is_dir) for name, is_dir in listing["entries"]]
+            yield from index_tasks(
+                src_dir, os.path.normpath(os.path.join(root_doc, src_dir)),
+                [tuple(x) for x in listing["parent_link"]], index_page_size, entries
+            )
+
+    global run_report
+    run_report = RunReport()
+    BuildPipeline(minify=minify).run(tasks())
+    if remove_manifests:
+        for shard in range(shard_count):
+            os.remove(shard_manifest_path(root_doc, shard, shard_count))
+    print(run_report.summary())
+
+
+def renderer_settings() -> tuple:
+    """ Returns the renderer settings `pydoc_runner` may change, to be restored by `restore_renderer_settings`. """
+    return fragment_cache, parse_cache, markdown_backend
+
+def restore_renderer_settings(settings: tuple) -> None:
+    global fragment_cache, parse_cache, markdown_backend
+    fragment_cache, parse_cache, markdown_backend = settings
+
+def pydoc_runner_process_dir(root_src: str, root_doc: str, parent_link: list[Tuple[str, str]]):
+    BuildPipeline().run(scan_tree(root_src, root_doc, parent_link))
+
+def pydoc_runner(root_src: str, root_doc: str, cache_dir: str=None, cache_max_bytes: int=256 * 1024 * 1024,
+                 markdown_backend: str=None, queue_size: int=64, max_file_bytes: int=None, max_lines: int=None,
+                 max_render_seconds: float=None, degraded_highlight: bool=False, parallel_sections: int=None,
+                 workers: int=None, git_revisions: Tuple[str, Optional[str]]=None, minify: bool=False,
+                 index_page_size: int=None, doc_store: str=None, doc_store_compress: bool=False, dedupe: bool=True,
+                 shard: Tuple[int, int]=None):
     """
     Args:
 
     * root_src: Root path of source directory.
     * root_doc: Root path of doc directory.
+    * cache_dir: Optional directory of the persistent caches. Parsed files, highlighted code and
+      converted Markdown are reused from there across builds.
+    * cache_max_bytes: Size limit of each cache.
+    * markdown_backend: Optional renderer of comments, "markdown" or "fast". The fast one handles the
+      Markdown subset of typical comments and falls back to Python-Markdown for everything else.
+    * queue_size: Capacity of the queues between the pipeline stages.
+    * max_file_bytes, max_lines: Optional limits per source file. Larger files are rendered on a
+      degraded path, as a single code block without any Markdown.
+    * max_render_seconds: Optional time budget for parsing and rendering a file. Budgeted pages are
+      rendered in a worker process, which is terminated once the budget is exceeded, and the file is
+      rendered on the degraded path as well. Like `parallel_sections`, this needs an
+      `if __name__ == "__main__":` guard in scripts.
+    * degraded_highlight: Highlight the code of degraded files instead of a plain <pre>.
+    * parallel_sections: Optional section count above which the sections of a single page are
+      rendered in chunks by a pool of `workers` processes. The workers are started with forkserver or
+      spawn, so scripts using it need an `if __name__ == "__main__":` guard.
+    * git_revisions: Optional (rev_from, rev_to) pair for a partial build of an existing `root_doc`.
+      Only files git reports as added, modified, renamed or deleted between both revisions and their
+      ancestor index pages are regenerated. With rev_to None, the working tree is compared, and
+      untracked files that are not ignored count as added.
+    * minify: Collapse insignificant whitespace of all pages.
+    * index_page_size: Optional number of entries per index page. Larger directories get paginated
+      index pages index.html, index-2.html, ...
+    * doc_store: Optional path of a SQLite database receiving all pages instead of the `root_doc`
+      directory. Page paths are relative to `root_doc`, which is not created. Unchanged pages are not
+      rewritten and pages of removed sources are deleted. Read pages back with `read_doc_page`.
+    * doc_store_compress: Store the pages zlib compressed.
+    * dedupe: Render files with identical content only once. Copies just get their own breadcrumb header.
+    * shard: Optional (i, N) to build only shard i of N. Each shard renders a hash-partitioned subset
+      of the files and writes a manifest into `root_doc`, instead of the index pages. Once the doc
+      directories of all shards are combined, `pydoc_merge_shards` generates the index pages.
     """
-    parent_links = [("Home", "index.html")]
-    pydoc_runner_process_dir(root_src, root_doc, parent_links)
-
+    if doc_store is not None and git_revisions is not None:
+        print("Partial builds from git are not supported with a doc store.")
+        exit(-1)
+    if shard is not None and (git_revisions is not None or doc_store is not None):
+        print("Sharded builds write a doc directory and cannot be combined with git_revisions or doc_store.")
+        exit(-1)
+    if shard is not None and not (len(shard) == 2 and shard[1] >= 1 and 0 <= shard[0] < shard[1]):
+        print("Invalid shard {}, expected (i, N) with N >= 1 and 0 <= i < N.".format(shard))
+        exit(-1)
+    # The settings below are module globals, a later call in the same process must not inherit them.
+    settings = renderer_settings()
+    try:
+        if markdown_backend is not None:
+            set_markdown_backend(markdown_backend)
+        if cache_dir is not None:
+            enable_fragment_cache(os.path.join(cache_dir, "fragments"), cache_max_bytes)
+            enable_parse_cache(os.path.join(cache_dir, "parsed"), cache_max_bytes)
+        global run_report
+        run_report = RunReport()
+        if git_revisions is not None:
+            tasks = git_diff_tasks(root_src, root_doc, *git_revisions, index_page_size=index_page_size)
+        elif shard is not None:
+            # The merge step paginates, so the listings are kept in one piece.
+            manifest = {"root_doc": root_doc, "pages": [], "listings": {}}
+            tasks    = shard_tasks(scan_tree(root_src, root_doc, [("Home", "index.html")]), root_src, *shard, manifest)
+        else:
+            tasks = scan_tree(root_src, root_doc, [("Home", "index.html")], index_page_size, make_dirs=doc_store is None)
+        store = None if doc_store is None else SqliteDocStore(doc_store, root_doc, doc_store_compress)
+        try:
+            BuildPipeline(
+                queue_size, max_file_bytes, max_lines, max_render_seconds, degraded_highlight, parallel_sections, workers,
+                minify=minify, store=store, dedupe=dedupe
+            ).run(tasks)
+        except BaseException:
+            # Pages not reached by a failed run are no reason to drop their rows.
+            if store is not None:
+                store.close(remove_stale=False)
+            raise
+        if store is not None:
+            store.close()
+        if shard is not None:
+            write_shard_manifest(root_doc, *shard, manifest)
+        for cache in (fragment_cache, parse_cache):
+            if cache is not None:
+                cache.prune()
+        print(run_report.summary())
+    finally:
+        restore_renderer_settings(settings)
@@ -0,0 +1,103 @@
+import timeit, contextlib
+from pygments import highlight
+from pygments.lexers import PythonLexer
+from pygments.formatters import HtmlFormatter
+from PyDoc import Section, Header, CodeBlock, parse_source, build_page, python_lexer, html_formatter, md, fast_md
+
+# Benchmark of the per-section rendering costs on a section-heavy file. The micro cases compare
+# single steps, the page case renders the whole file with the former implementations patched in
+# (fresh Pygments objects per code block, header rendered on every page) and with the current ones.
+
+SECTIONS = 2000
+REPEAT   = 5
+
+source = "".join(
+    '''
+def function_{0}(a, b):
+    """
+    Returns the sum of `a` and `b`, see $a + b$.
+    """
+    # Add both
+    return a + b  # {0}
+'''.format(i) for i in range(SECTIONS)
+)
+parent_link = [("Home", "../../index.html"), ("FirstSub", "../index.html"), ("FirstSubSub", "index.html")]
+code        = "    return a + b\n"
+
+def old_highlight():
+    return highlight(code, PythonLexer(), HtmlFormatter())
+
+def new_highlight():
+    return highlight(code, python_lexer, html_formatter)
+
+def old_breadcrumbs():
+    tmp = r""
+    for parent in parent_link:
+        tmp += r"""<a class="parent" href="{}">{}</a>""".format(parent[1], parent[0])
+    return tmp
+
+def new_breadcrumbs():
+    return Header.breadcrumb_html(parent_link)
+
+with open("demo/single_file/example.py", "r", encoding="utf8") as f:
+    comments = [x.comment for x in parse_source(f.read()) if x.comment]
+
+def old_comments():
+    return [md.reset().convert(comment) for comment in comments]
+
+def new_comments():
+    # Same fallback as convert_markdown with the "fast" backend.
+    return [fast_md.convert(comment) or md.reset().convert(comment) for comment in comments]
+
+def former_code_render(self):
+    c = highlight(self.code_str, PythonLexer(), HtmlFormatter()) if self.code_str != r"" else r""
+    return self.html_template.replace(self.code_key_phrase, c)
+
+@contextlib.contextmanager
+def patched(*replacements):
+    """ Temporarily replaces (class, attribute, value) of PyDoc. """
+    originals = [(cls, name, cls.__dict__[name]) for cls, name, _ in replacements]
+    for cls, name, value in replacements:
+        setattr(cls, name, value)
+    try:
+        yield
+    finally:
+        for cls, name, value in originals:
+            setattr(cls, name, value)
+
+former = [(CodeBlock, "render", former_code_render), (Header, "render", Section.render)]
+
+def best_per_call(function, number: int) -> float:
+    return min(timeit.repeat(function, number=number, repeat=REPEAT)) / number
+
+if __name__ == "__main__":
+    assert old_highlight() == new_highlight()
+    assert old_breadcrumbs() == new_breadcrumbs()
+    assert [x.replace("<em>", "").replace("</em>", "") for x in old_comments()] == new_comments()
+
+    # (name, former, current, calls per timing, items handled per call)
+    for name, old, new, number, items in [
+        ("highlight code block", old_highlight, new_highlight, 2000, 1),
+        ("breadcrumbs", old_breadcrumbs, new_breadcrumbs, 100000, 1),
+        ("comment markdown", old_comments, new_comments, 500, len(comments)),
+    ]:
+        t_old = best_per_call(old, number) / items
+        t_new = best_per_call(new, number) / items
+        print("{:<22} {:>9.2f} us -> {:>9.2f} us per item ({:.1f}x)".format(name, t_old * 1e6, t_new * 1e6, t_old / t_new))
+
+    parsed = parse_source(source)
+
+    def render_page():
+        # A new page each time, as for every file of a build.
+        return build_page(parsed, parent_link).render()
+
+    with patched(*former):
+        former_html = render_page()
+        t_former = best_per_call(render_page, 1)
+    t_current = best_per_call(render_page, 1)
+    assert former_html == render_page()
+
+    sections = len(build_page(parsed).sections)
+    print("page render, {} sections, per section:".format(sections))
+    for name, t in [("former", t_former), ("current", t_current)]:
+        print("  {:<20} {:>9.2f} us ({:.2f}x)".format(name, t / sections * 1e6, t_former / t))
@@ -0,0 +1,113 @@
+import random
+from PyDoc import FastMarkdown, Markdown, md_extensions, md_extension_configs, parse_source
+
+# Differential check of FastMarkdown against Python-Markdown. Both outputs are compared after
+# removing <em>, as Page.clean_markdown_for_katex does for every page. Inputs FastMarkdown
+# does not support (convert returns None) are skipped, they are rendered by Python-Markdown.
+
+fast_md = FastMarkdown()
+md      = Markdown(extensions=md_extensions, extension_configs=md_extension_configs)
+
+def clean(_html: str) -> str:
+    return _html.replace("<em>", "").replace("</em>", "")
+
+def mismatches(texts) -> list:
+    found = []
+    for text in texts:
+        got = fast_md.convert(text)
+        if got is None:
+            continue
+        md.reset()
+        ref = md.convert(text)
+        if clean(got) != clean(ref):
+            found.append((text, ref, got))
+    return found
+
+fixed_corpus = [
+    "",
+    "\n",
+    "Plain text.",
+    "# Heading\n\nSome text with `code` and $x^2$.",
+    "## Args\n\n- a: first value\n- b: second value",
+    "* item\n    * nested item\n* item",
+    "Returns **bold** and *emphasis*, a_b_c and $$\\sum_i x_i$$.",
+    "Line one  \nline two",
+    "Entities &amp; &copy; and a & b, 1 < 2.",
+    "Inline <b>html</b> and <br> tags.",
+    "Unicode é and \\alpha.",
+    "---",
+    "1. ordered",
+    "[link](x)",
+    "\tTabbed",
+    "<div>block</div>",
+]
+
+words = [
+    "value", "the", "`x`", "`a < b`", "$x^2$", "$$\\sum_i x_i$$", "**bold**", "*em*", "x_y", "(float)", ":",
+    "foo.", "<br>", "<b>b</b>", "&amp;", "a & b", "1 < 2", "é", "$\\frac{a}{b}$"
+]
+# Words FastMarkdown leaves to Python-Markdown, mixed in rarely.
+fallback_words = ["\\alpha", "_u_", "[link](x)", "1 < b", "`x", "<div>"]
+
+tokens = [
+    "\n    - ", "\n    * ", "word", "foo", "x", " ", " ", " ", "  ", "\n", "\n", "\n\n", "  \n", "*", "**", "`", "$",
+    "$$", "_", "a_b", "<b>", "</b>", "<br>", "<a href=\"x\">", "</a>", "&", "&amp;", "<", ">", "# ", "## ", "- ",
+    "* ", "\\alpha", "#", "é", "'", '"', "1. ", "[x]", "  - ", "<div>", "&#12", "&copy;", "---", "\t", "    "
+]
+
+def random_document(rng: random.Random) -> str:
+    """ Comment-like documents of headings, (nested) bullet lists and paragraphs. """
+    def inline():
+        return " ".join(
+            rng.choice(fallback_words if rng.random() < 0.02 else words) for _ in range(rng.randint(1, 6))
+        )
+
+    def block():
+        r = rng.random()
+        if r < 0.2:
+            return "#" * rng.randint(1, 3) + " " + inline()
+        if r < 0.6:
+            out = []
+            for _ in range(rng.randint(1, 4)):
+                out.append(rng.choice("*-") + " " + inline())
+                for _ in range(rng.choice([0, 0, 1, 2])):
+                    out.append("    " + rng.choice("*-") + " " + inline())
+                if rng.random() < 0.1:
+                    out.append(inline())
+            return "\n".join(out)
+        return "\n".join(inline() + rng.choice(["", " ", "  "]) for _ in range(rng.randint(1, 3)))
+
+    return rng.choice(["", " \n", "\n"]) + rng.choice(["\n\n", "\n    \n", "\n"]).join(
+        block() for _ in range(rng.randint(1, 4))
+    )
+
+def random_tokens(rng: random.Random) -> str:
+    """ Arbitrary token soup, mostly exercising the fallback decisions. """
+    text = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 14)))
+    if rng.random() < 0.5:
+        text = rng.choice(["# Head\n\n", "- a\n- b\n", "text\n", ""]) + text
+    return text
+
+def test_fixed_corpus():
+    assert mismatches(fixed_corpus) == []
+
+def test_demo_comments():
+    with open("demo/single_file/example.py", "r", encoding="utf8") as f:
+        comments = [x.comment for x in parse_source(f.read()) if x.comment]
+    assert comments
+    assert mismatches(comments) == []
+
+def test_random_documents():
+    rng = random.Random(27)
+    assert mismatches([random_document(rng) for _ in range(5000)]) == []
+
+def test_random_tokens():
+    rng = random.Random(2027)
+    assert mismatches([random_tokens(rng) for _ in range(5000)]) == []
+
+def test_fast_path_is_taken():
+    # The comparison is only meaningful if FastMarkdown renders a good share of the documents itself.
+    # Mixed list markers and the rare fallback words send the others to Python-Markdown.
+    rng   = random.Random(27)
+    texts = [random_document(rng) for _ in range(1000)]
+    assert sum(fast_md.convert(x) is not None for x in texts) > len(texts) // 4